@@ -1,6 +1,82 @@
+import os
+import json
 import pandas as pd
-from utils import load_existing_table, save_table, normalize_payee, confirm_category
-from llm import categorize_expense
+from utils import (
+    load_existing_table,
+    save_table,
+    normalize_payee_column,
+    confirm_category,
+    remember_canonical_payees,
+    unknown_payees,
+)
+from llm import (
+    batch_results,
+    categorize_expenses_batch,
+    payee_batch_results,
+    submit_batch,
+    submit_payee_batch,
+)
+
+
+# Transactions waiting on a Batch API job, one Parquet file per batch id, plus
+# a <batch id>.payees.json file when new vendor names were sent for cleaning
+BATCH_DIR = "data/batches"
+
+
+def _txn_key(df):
+    """Return the ``payee|date|amount`` composite key for each row of ``df``."""
+
+    return df["payee"].astype(str).str.cat(
+        [df["date"].astype(str), df["amount"].astype(str)], sep="|"
+    )
+
+
+def _queue_for_llm(pending, payee, display_payee, group):
+    """Ask for a note and queue the vendor for batched LLM categorization."""
+
+    note = input("Describe the expense in plain English: ")
+    pending.append((payee, (display_payee, group["amount"].mean(), note)))
+    return None, note
+
+
+def _unprocessed_rows(existing, data):
+    """Return the rows of ``data`` that are not in ``existing`` yet.
+
+    Both frames gain ``normalized_payee`` and ``transaction_key`` columns.
+    """
+
+    # Ensure consistent column types; Parquet tables and normalized statements
+    # already carry datetimes, so only parse when needed
+    for df in (existing, data):
+        if not pd.api.types.is_datetime64_any_dtype(df["date"]):
+            df["date"] = pd.to_datetime(df["date"], errors="coerce")
+
+    # Normalize payee names for smarter grouping
+    # Only normalize each distinct payee once, then map the result back to rows
+    payees = pd.concat([existing["payee"], data["payee"]], ignore_index=True)
+    normalized = normalize_payee_column(payees).to_numpy()
+    existing["normalized_payee"] = normalized[: len(existing)]
+    data["normalized_payee"] = normalized[len(existing):]
+
+    # Mark each row with a composite key so we don’t re-insert duplicates
+    existing["transaction_key"] = _txn_key(existing)
+    data["transaction_key"] = _txn_key(data)
+
+    # The loaded table is already categorical; re-encode the recomputed payees
+    # so the per-vendor filters keep comparing integer codes
+    existing["normalized_payee"] = existing["normalized_payee"].astype("category")
+
+    # Anti-join against the keys we already have
+    return (
+        data.merge(
+            existing[["transaction_key"]].drop_duplicates(),
+            on="transaction_key",
+            how="left",
+            indicator=True,
+        )
+        .query("_merge == 'left_only'")
+        .drop(columns=["_merge"])
+    )
 
 
 def main(data, account_type="business"):
@@ -12,34 +88,49 @@ def main(data, account_type="business"):
         New bank transactions to categorize.
     account_type: str
         Either "personal" or "business" to control default assumptions.
+
+    Returns
+    -------
+    DataFrame
+        The categorized table including the newly saved rows.
     """
 
     existing = load_existing_table()
+    unprocessed_data = _unprocessed_rows(existing, data)
 
-    # Ensure consistent column types
-    existing["date"] = pd.to_datetime(existing["date"], errors="coerce")
-    data["date"] = pd.to_datetime(data["date"], errors="coerce")
+    print(f"{len(unprocessed_data)} new transactions need categorization.\n")
 
-    # Normalize payee names for smarter grouping
-    existing["normalized_payee"] = existing["payee"].apply(normalize_payee)
-    data["normalized_payee"] = data["payee"].apply(normalize_payee)
+    # Rows categorized this run; written to disk and merged once at the end
+    new_rows = []
 
-    # Mark each row with a composite key so we don’t re-insert duplicates
-    existing["transaction_key"] = existing.apply(
-        lambda r: f"{r['payee']}|{r['date']}|{r['amount']}", axis=1
-    )
-    data["transaction_key"] = data.apply(
-        lambda r: f"{r['payee']}|{r['date']}|{r['amount']}", axis=1
+    # Group new transactions by normalized payee so we categorize once per vendor
+    history_by_payee = dict(
+        iter(existing.groupby("normalized_payee", sort=False, observed=True))
     )
+    groups = [
+        (payee, group, history_by_payee.get(payee, existing.iloc[:0]))
+        for payee, group in unprocessed_data.groupby("normalized_payee")
+    ]
 
-    processed_keys = set(existing["transaction_key"])
-    unprocessed_data = data[~data["transaction_key"].isin(processed_keys)]
-
-    print(f"{len(unprocessed_data)} new transactions need categorization.\n")
+    # Amount statistics per vendor over historical and new rows, in one pass
+    amount_stats = (
+        pd.concat(
+            [
+                existing[["normalized_payee", "amount"]].astype({"normalized_payee": object}),
+                unprocessed_data[["normalized_payee", "amount"]],
+            ]
+        )
+        .groupby("normalized_payee")["amount"]
+        .agg(["mean", "std"])
+    )
 
-    # Group new transactions by normalized payee so we categorize once per vendor
-    for payee, group in unprocessed_data.groupby("normalized_payee"):
-        payee_history = existing[existing["normalized_payee"] == payee]
+    # First pass: gather every note from the user and queue the LLM requests.
+    # ``defaults`` maps a vendor, or the index of an outlier row, to its
+    # (category, note); ``outliers`` holds each vendor's outlier mask.
+    defaults = {}
+    outliers = {}
+    pending = []
+    for payee, group, payee_history in groups:
         display_payee = group.iloc[0]["payee"]
         used_categories = payee_history["category"].dropna().unique()
 
@@ -51,9 +142,9 @@ def main(data, account_type="business"):
             if len(used_categories) == 0:
                 # Brand new payee, let the model classify
                 print(f"🆕 New payee: '{display_payee}'")
-                note = input("Describe the expense in plain English: ")
-                default_category = categorize_expense(display_payee, group["amount"].mean(), note)
-                default_note = note
+                default_category, default_note = _queue_for_llm(
+                    pending, payee, display_payee, group
+                )
             elif len(used_categories) == 1:
                 auto_cat = used_categories[0]
                 print(f"Previously, '{display_payee}' was always categorized as '{auto_cat}'")
@@ -67,9 +158,9 @@ def main(data, account_type="business"):
                     default_category = "PERSONAL"
                     default_note = "Personal expense"
                 else:
-                    note = input("Describe the expense in plain English: ")
-                    default_category = categorize_expense(display_payee, group["amount"].mean(), note)
-                    default_note = note
+                    default_category, default_note = _queue_for_llm(
+                        pending, payee, display_payee, group
+                    )
             else:
                 print(f"\nWe’ve seen multiple categories for '{display_payee}' in the past:")
                 for i, cat in enumerate(used_categories):
@@ -86,60 +177,202 @@ def main(data, account_type="business"):
                         default_category = selected_cat
                         default_note = last_note if pd.notna(last_note) else ""
                     else:
-                        note = input("Describe the expense in plain English: ")
-                        default_category = categorize_expense(display_payee, group["amount"].mean(), note)
-                        default_note = note
+                        default_category, default_note = _queue_for_llm(
+                            pending, payee, display_payee, group
+                        )
                 elif choice == "p":
                     default_category = "PERSONAL"
                     default_note = "Personal expense"
                 else:
-                    note = input("Describe the expense in plain English: ")
-                    default_category = categorize_expense(display_payee, group["amount"].mean(), note)
-                    default_note = note
+                    default_category, default_note = _queue_for_llm(
+                        pending, payee, display_payee, group
+                    )
 
-        # Combine historical and new amounts to detect outliers
-        amounts_history = pd.concat([payee_history["amount"], group["amount"]])
-        mean_amount = amounts_history.mean()
-        std_amount = amounts_history.std()
+        defaults[payee] = (default_category, default_note)
 
-        for _, row in group.iterrows():
-            amount = row["amount"]
-            date = row["date"]
+        # Historical and new amounts together decide what counts as an outlier
+        mean_amount, std_amount = amount_stats.loc[payee]
 
-            is_outlier = (
-                pd.notna(std_amount)
-                and std_amount > 0
-                and abs(amount - mean_amount) > 2 * std_amount
-            )
+        is_outlier = ((group["amount"] - mean_amount).abs() > 2 * std_amount) & (
+            std_amount > 0
+        )
+        outliers[payee] = is_outlier
 
-            if is_outlier:
-                print(
-                    f"⚠️ Unusual amount for {display_payee}: ${amount:.2f} (mean ${mean_amount:.2f})"
-                )
-                note = input(
-                    "Describe this transaction, or prefix with 'p ' for personal: "
-                )
-                if note.startswith("p "):
-                    category = "PERSONAL"
-                    note = note[2:].strip()
-                else:
-                    category = categorize_expense(display_payee, amount, note)
-            else:
-                category = default_category
-                note = default_note
-
-            category = confirm_category(category)
-
-            new_row = {
-                "payee": row["payee"],
-                "normalized_payee": payee,
-                "date": date,
-                "amount": amount,
-                "note": note,
-                "category": category,
-            }
-            existing = pd.concat([existing, pd.DataFrame([new_row])], ignore_index=True)
-            save_table(existing)
+        # Only unusual amounts need a note of their own
+        for idx, row in group[is_outlier].iterrows():
+            amount = row["amount"]
             print(
-                f"✅ Saved: {row['payee']} [{category}] on {date.date()} => ${amount:.2f}\n"
+                f"⚠️ Unusual amount for {display_payee}: ${amount:.2f} (mean ${mean_amount:.2f})"
+            )
+            note = input(
+                "Describe this transaction, or prefix with 'p ' for personal: "
             )
+            if note.startswith("p "):
+                defaults[idx] = ("PERSONAL", note[2:].strip())
+            else:
+                pending.append((idx, (display_payee, amount, note)))
+
+    # Categorize every queued vendor and outlier with concurrent, batched requests
+    # before asking the user to confirm anything
+    if pending:
+        try:
+            categories = categorize_expenses_batch([item for _, item in pending])
+        except Exception as exc:
+            # Keep the notes already collected; the user can still set categories
+            print(f"⚠️ Categorization failed ({exc}); suggesting 'Uncategorized'.")
+            categories = ["Uncategorized"] * len(pending)
+        for (key, (_, _, note)), category in zip(pending, categories):
+            defaults[key] = (category, note)
+
+    # Second pass: confirm each transaction. Rows are saved together in one
+    # append (each Parquet append rewrites the table), and the ``finally``
+    # keeps what was confirmed if the run stops early: Ctrl-C, an error or a
+    # Streamlit rerun.
+    try:
+        for payee, group, _ in groups:
+            display_payee = group.iloc[0]["payee"]
+            default_category, default_note = defaults[payee]
+            is_outlier = outliers[payee]
+
+            # Typical amounts share the vendor default, confirmed once for the group
+            normal_rows = group[~is_outlier]
+            if len(normal_rows):
+                print(f"{len(normal_rows)} transaction(s) from '{display_payee}'")
+                category = confirm_category(default_category)
+                sub = normal_rows[["payee", "date", "amount", "transaction_key"]].assign(
+                    normalized_payee=payee, note=default_note, category=category
+                )
+                new_rows.append(sub)
+                print(f"✅ {len(sub)} transaction(s) for {display_payee} [{category}]\n")
+
+            for idx, row in group[is_outlier].iterrows():
+                amount = row["amount"]
+                date = row["date"]
+                category, note = defaults[idx]
+                category = confirm_category(category)
+
+                new_row = {
+                    "payee": row["payee"],
+                    "normalized_payee": payee,
+                    "date": date,
+                    "amount": amount,
+                    "note": note,
+                    "category": category,
+                    "transaction_key": row["transaction_key"],
+                }
+                sub = pd.DataFrame([new_row])
+                new_rows.append(sub)
+                print(f"✅ {row['payee']} [{category}] on {date.date()} => ${amount:.2f}\n")
+    finally:
+        if new_rows:
+            added = pd.concat(new_rows, ignore_index=True)
+            save_table(added, append=True)
+            print(f"💾 Saved {len(added)} transaction(s).")
+
+    if new_rows:
+        existing = pd.concat([existing, added], ignore_index=True)
+    return existing
+
+
+def submit_vendor_batch(data, account_type="business", batch_dir=BATCH_DIR):
+    """Queue one Batch API request per new vendor in ``data``.
+
+    Only vendors with transactions missing from the table are sent. Vendor
+    names without a canonical name yet go out in a second batch for
+    ``normalize_payees``. The rows waiting on each request are kept in
+    ``batch_dir`` until ``apply_vendor_batch`` saves them.
+
+    Personal statements need no model, so their new rows are saved as
+    PERSONAL right away, as ``main`` would.
+
+    Returns
+    -------
+    str or None
+        The batch id, or ``None`` if nothing was submitted.
+    """
+
+    unprocessed = _unprocessed_rows(load_existing_table(), data)
+    if unprocessed.empty:
+        return None
+
+    if account_type == "personal":
+        save_table(
+            unprocessed[["payee", "date", "amount", "transaction_key", "normalized_payee"]]
+            .assign(note="Personal expense", category="PERSONAL"),
+            append=True,
+        )
+        return None
+
+    vendors = unprocessed.groupby("normalized_payee", sort=False).agg(
+        payee=("payee", "first"), amount=("amount", "mean")
+    )
+    batch_id = submit_batch(vendors.assign(note="").itertuples(index=False))
+
+    # submit_batch keys its requests row-<n> in submission order
+    custom_ids = {payee: f"row-{i}" for i, payee in enumerate(vendors.index)}
+    os.makedirs(batch_dir, exist_ok=True)
+    unprocessed.assign(
+        custom_id=unprocessed["normalized_payee"].map(custom_ids)
+    ).to_parquet(os.path.join(batch_dir, f"{batch_id}.parquet"), index=False)
+
+    new_payees = unknown_payees(vendors.index)
+    if new_payees:
+        payee_job = {"batch_id": submit_payee_batch(new_payees), "payees": new_payees}
+        with open(os.path.join(batch_dir, f"{batch_id}.payees.json"), "w") as f:
+            json.dump(payee_job, f)
+    return batch_id
+
+
+def apply_vendor_batch(batch_id, batch_dir=BATCH_DIR):
+    """Save the transactions of a finished batch with their categories.
+
+    Returns
+    -------
+    int or None
+        Rows saved, or ``None`` while the batch is still running.
+
+    Raises
+    ------
+    RuntimeError
+        If the batch failed, expired or was cancelled.
+    """
+
+    results = batch_results(batch_id)
+    if results is None:
+        return None
+
+    payees_path = os.path.join(batch_dir, f"{batch_id}.payees.json")
+    if os.path.exists(payees_path):
+        with open(payees_path) as f:
+            payee_job = json.load(f)
+        try:
+            names = payee_batch_results(payee_job["batch_id"], payee_job["payees"])
+        except RuntimeError:
+            # The names are cleaned with live requests the next time the table loads
+            names = {}
+        if names is None:
+            return None
+        remember_canonical_payees(names)
+        os.remove(payees_path)
+
+    path = os.path.join(batch_dir, f"{batch_id}.parquet")
+    rows = pd.read_parquet(path)
+    # Rows saved since the batch was submitted are not added twice
+    rows = _unprocessed_rows(load_existing_table(), rows.drop(columns=["normalized_payee"]))
+    rows = rows[["payee", "date", "amount", "transaction_key", "normalized_payee"]].assign(
+        note="", category=rows["custom_id"].map(results).fillna("Uncategorized")
+    )
+    if len(rows):
+        save_table(rows, append=True)
+    os.remove(path)
+    return len(rows)
+
+
+def discard_vendor_batch(batch_id, batch_dir=BATCH_DIR):
+    """Forget a batch whose results will never arrive."""
+
+    for name in (f"{batch_id}.parquet", f"{batch_id}.payees.json"):
+        path = os.path.join(batch_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
@@ -2,13 +2,88 @@
 
 import os
 import json
-from openai import OpenAI
+import asyncio
+import re
+import atexit
+import functools
+import threading
+import time
+from typing import Iterable
+import httpx
+import numpy as np
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
 
+import llm_cache
+import semantic_cache
+
+
+# Both clients use tuned connection pools so TCP/TLS setup is paid once and
+# kept alive across the many small requests a statement generates.
+_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+_http = DefaultHttpxClient(limits=_LIMITS, timeout=_TIMEOUT)
+atexit.register(_http.close)
+
+# Rate limits (429), timeouts, connection errors and 5xx responses are retried
+# by the SDK with jittered exponential backoff that honours Retry-After, so a
+# transient failure costs a short wait instead of restarting the whole run.
+MAX_RETRIES = 6
+
+
+def _api_key() -> str:
+    # Checked before any request so a missing key fails immediately instead of
+    # costing a round trip per call just to come back as a 401.
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    return api_key
+
+
+@functools.lru_cache(maxsize=1)
+def get_client() -> OpenAI:
+    """Return the shared OpenAI client, creating it on first use.
+
+    The API key is read from the ``OPENAI_API_KEY`` environment variable so the
+    script can run without modifying the source code.
+    """
+
+    return OpenAI(api_key=_api_key(), http_client=_http, max_retries=MAX_RETRIES)
+
+
+@functools.lru_cache(maxsize=1)
+def get_aclient() -> AsyncOpenAI:
+    """Return the shared async client, creating it on first use.
+
+    The async client lets independent requests overlap instead of waiting in
+    turn. It always runs on one background event loop (see ``_run``) because
+    pooled connections are bound to the loop that opened them.
+    """
+
+    return AsyncOpenAI(
+        api_key=_api_key(),
+        http_client=DefaultAsyncHttpxClient(limits=_LIMITS, timeout=_TIMEOUT),
+        max_retries=MAX_RETRIES,
+    )
+
+
+def __getattr__(name):
+    # ``llm.client`` and ``llm.aclient`` stay available as module attributes
+    if name == "client":
+        return get_client()
+    if name == "aclient":
+        return get_aclient()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, daemon=True).start()
+
+
+def _run(coro):
+    """Run ``coro`` on the shared background event loop and wait for the result."""
+
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()
 
-# Instantiate the OpenAI client with the user's API key from the environment.
-# Reading the key from an environment variable makes the script easier to run
-# without modifying the source code.
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
 
 # Some example pairs: (note, bookkeeping category)
 EXAMPLES = [
@@ -38,9 +113,80 @@ EXAMPLES = [
     ),
 ]
 
+# The only labels the model may return. Free-text replies drifted between
+# spellings ("Meals" vs "Meals & Entertainment") and split the summary groups.
+CATEGORIES = (
+    "Advertising",
+    "Bank Fees",
+    "Charitable Contributions",
+    "Education & Training",
+    "Equipment",
+    "Insurance",
+    "Meals & Entertainment",
+    "Office Expenses",
+    "Office Supplies",
+    "Professional Services",
+    "Rent",
+    "Research & Development",
+    "Software & Subscriptions",
+    "Travel",
+    "Utilities",
+    "Uncategorized",
+)
+
+# Structured Outputs schema: the reply must be {"category": <one of CATEGORIES>}
+_CATEGORY_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "category",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"category": {"type": "string", "enum": list(CATEGORIES)}},
+            "required": ["category"],
+            "additionalProperties": False,
+        },
+    }
+}
+
+# Instructions, built once. Nothing per-call (dates, IDs) may be interpolated
+# here or the provider-side prompt cache will miss.
+_STATIC_PREFIX = (
+    "You are a helpful bookkeeper that assigns categories to business expenses. "
+    "Respond ONLY with the best-fitting category name, chosen from: "
+    + ", ".join(CATEGORIES)
+    + "."
+)
+_BASE_MESSAGES = ({"role": "developer", "content": _STATIC_PREFIX},)
+
+# Single requests only carry the few-shot examples closest to the transaction
+FEW_SHOT_K = 3
+
+
+def _cache_args(description, amount, note):
+    """Normalize categorization inputs so equivalent requests share a cache entry."""
+
+    return description, round(float(amount), 2), str(note).strip().lower()
+
+
+def _cache_key(description, amount, note) -> str:
+    # The prompt is part of the key so editing the examples invalidates old answers
+    return llm_cache.make_key({
+        "model": "gpt-4o",
+        "prompt": _STATIC_PREFIX,
+        "examples": EXAMPLES,
+        "description": description,
+        "amount": amount,
+        "note": note,
+    })
+
+
 def categorize_expense(description: str, amount: float, note: str) -> str:
     """Return a bookkeeping category for the given transaction.
 
+    Results are cached in memory and on disk, keyed on the description, the
+    amount rounded to cents and the lower-cased note.
+
     Parameters
     ----------
     description:
@@ -51,43 +197,417 @@ def categorize_expense(description: str, amount: float, note: str) -> str:
         Free-form note provided by the user.
     """
 
-    # We'll build a conversation of role/content objects. "developer" acts like a
-    # system-level instruction.
-    messages = [{
+    return _categorize_cached(*_cache_args(description, amount, note)) or "Uncategorized"
+
+
+@functools.lru_cache(maxsize=4096)
+def _categorize_cached(description: str, amount: float, note: str) -> str | None:
+    key = _cache_key(description, amount, note)
+    category = llm_cache.get(key)
+    if category is None:
+        # Fall back to a near-duplicate request before paying for a completion
+        vector = semantic_cache.embed(get_client(), [_semantic_text(description, note)])[0]
+        category = semantic_cache.lookup(vector)
+        if category is None:
+            category = _request_category(description, amount, note, vector)
+            # Unusable replies are not persisted so a later run asks again
+            if category is None:
+                return None
+            semantic_cache.add(vector, category)
+            semantic_cache.flush()
+        llm_cache.put(key, category)
+    return category
+
+
+def _semantic_text(description: str, note: str) -> str:
+    return f"{description} || {note}"
+
+
+@functools.cache
+def _example_vectors() -> np.ndarray:
+    """Embeddings of the ``EXAMPLES`` notes, computed once and kept on disk."""
+
+    notes = [ex_note for ex_note, _ in EXAMPLES]
+    key = llm_cache.make_key({"model": semantic_cache.EMBEDDING_MODEL, "examples": notes})
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return np.array(json.loads(cached), dtype=np.float32)
+    vectors = semantic_cache.embed(get_client(), notes)
+    llm_cache.put(key, json.dumps(vectors.tolist()))
+    return vectors
+
+
+def _nearest_examples(vector: np.ndarray, k: int = FEW_SHOT_K) -> list[tuple[str, str]]:
+    """Return the ``k`` examples most similar to ``vector``, closest last."""
+
+    sims = _example_vectors() @ vector
+    return [EXAMPLES[i] for i in np.argsort(sims)[-k:]]
+
+
+def _single_messages(
+    description: str, amount: float, note: str, vector: np.ndarray
+) -> list[dict]:
+    """Build the prompt for categorizing one transaction.
+
+    ``vector`` is the transaction's semantic-cache embedding, reused here to
+    pick the few-shot examples so no extra embedding call is needed.
+    """
+
+    shots = []
+    for ex_note, ex_cat in _nearest_examples(vector):
+        shots.append({"role": "user", "content": ex_note})
+        shots.append({"role": "assistant", "content": json.dumps({"category": ex_cat})})
+
+    # The developer instructions stay a byte-identical prefix across requests
+    return [
+        *_BASE_MESSAGES,
+        *shots,
+        {
+            "role": "user",
+            "content": f"Description: {description}. Amount: {amount}. Note: {note}",
+        },
+    ]
+
+
+def _request_category(
+    description: str, amount: float, note: str, vector: np.ndarray
+) -> str | None:
+    """Ask the model to categorize a single transaction."""
+
+    # Call the new 'responses' API
+    response = get_client().responses.create(
+        model="gpt-4o",
+        input=_single_messages(description, amount, note, vector),
+        text=_CATEGORY_FORMAT,
+    )
+
+    # 'response.output_text' holds the schema-constrained JSON reply
+    return _parse_category(response.output_text)
+
+
+def _parse_category(text: str) -> str | None:
+    """Return the category from a ``{"category": ...}`` Structured Outputs reply.
+
+    Refusals, malformed replies and labels outside ``CATEGORIES`` return
+    ``None``. Callers show ``"Uncategorized"`` instead, so one bad answer cannot
+    abort a whole run, but they do not cache it.
+    """
+
+    try:
+        category = json.loads(text)["category"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+    return category if category in CATEGORIES else None
+
+
+async def categorize_expense_async(description: str, amount: float, note: str) -> str:
+    """Async version of ``categorize_expense`` sharing the same caches."""
+
+    description, amount, note = _cache_args(description, amount, note)
+    key = _cache_key(description, amount, note)
+    category = llm_cache.get(key)
+    if category is None:
+        vectors = await semantic_cache.aembed(
+            get_aclient(), [_semantic_text(description, note)]
+        )
+        category = semantic_cache.lookup(vectors[0])
+        if category is None:
+            response = await get_aclient().responses.create(
+                model="gpt-4o",
+                input=_single_messages(description, amount, note, vectors[0]),
+                text=_CATEGORY_FORMAT,
+            )
+            category = _parse_category(response.output_text)
+            if category is None:
+                return "Uncategorized"
+            semantic_cache.add(vectors[0], category)
+        llm_cache.put(key, category)
+    return category
+
+
+async def categorize_many(
+    rows: Iterable[tuple[str, float, str]], concurrency: int = 10
+) -> list[str]:
+    """Categorize each ``(description, amount, note)`` row with its own request.
+
+    Requests run concurrently, at most ``concurrency`` at a time. Use this when
+    every transaction needs its own answer; ``categorize_expenses_batch`` is
+    cheaper when they can share a prompt.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def categorize(row):
+        async with semaphore:
+            return await categorize_expense_async(*row)
+
+    return await asyncio.gather(*(categorize(row) for row in rows))
+
+
+# Larger batches start to hurt accuracy, so split longer lists into chunks
+BATCH_SIZE = 16
+
+# Concurrent requests in flight; kept modest to stay under rate limits
+MAX_CONCURRENCY = 8
+
+# One "[n] category" answer per line of a numbered reply
+_RE_NUMBERED = re.compile(r"^\[(\d+)\]\s*(.+)$", re.M)
+
+
+# Batched prompts share one prefix showing the numbered format with the examples
+_BATCH_BASE_MESSAGES = (
+    {
         "role": "developer",
         "content": (
             "You are a helpful bookkeeper that assigns categories to business expenses. "
-            "Respond ONLY with the best-fitting category name."
+            "You will receive numbered transactions like '[1] ...'. Respond ONLY with "
+            "one line per transaction in the form '[1] <category name>', choosing "
+            "each category from: " + ", ".join(CATEGORIES) + "."
         ),
-    }]
+    },
+    {
+        "role": "user",
+        "content": "\n".join(f"[{i}] {ex_note}" for i, (ex_note, _) in enumerate(EXAMPLES, 1)),
+    },
+    {
+        "role": "assistant",
+        "content": "\n".join(f"[{i}] {ex_cat}" for i, (_, ex_cat) in enumerate(EXAMPLES, 1)),
+    },
+)
 
-    # Provide few-shot examples as user + assistant pairs
-    for ex_note, ex_cat in EXAMPLES:
-        messages.append({"role": "user", "content": ex_note})
-        messages.append({"role": "assistant", "content": ex_cat})
 
-    # Then add the user's transaction
-    messages.append(
+def _batch_messages(chunk: list[tuple[str, float, str]]) -> list[dict]:
+    """Build a numbered multi-transaction prompt for ``chunk``."""
+
+    return [
+        *_BATCH_BASE_MESSAGES,
         {
             "role": "user",
-            "content": f"Description: {description}. Amount: {amount}. Note: {note}",
+            "content": "\n".join(
+                f"[{i}] Description: {description}. Amount: {amount}. Note: {note}"
+                for i, (description, amount, note) in enumerate(chunk, 1)
+            ),
+        },
+    ]
+
+
+async def _request_batch(chunk, semaphore) -> dict[int, str]:
+    """Send one numbered batch and return ``{number: category}``."""
+
+    async with semaphore:
+        response = await get_aclient().responses.create(
+            model="gpt-4o", input=_batch_messages(chunk)
+        )
+    return {
+        int(idx): cat.strip()
+        for idx, cat in _RE_NUMBERED.findall(response.output_text)
+    }
+
+
+async def _request_batches(chunks) -> list[dict[int, str]]:
+    """Send all batches concurrently, at most ``MAX_CONCURRENCY`` at a time."""
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    return await asyncio.gather(*(_request_batch(chunk, semaphore) for chunk in chunks))
+
+
+def categorize_expenses_batch(items: Iterable[tuple[str, float, str]]) -> list[str]:
+    """Return bookkeeping categories for many transactions using few requests.
+
+    Up to ``BATCH_SIZE`` transactions are numbered and sent in a single prompt so
+    the instructions and few-shot examples are only paid for once per batch, and
+    the batches themselves are sent concurrently.
+
+    Parameters
+    ----------
+    items:
+        ``(description, amount, note)`` tuples, as for ``categorize_expense``.
+        Any iterable works, e.g. ``df[["payee", "amount", "note"]].itertuples(
+        index=False)``.
+
+    Returns
+    -------
+    list
+        Categories in the same order as ``items``.
+    """
+
+    # Only transactions missing from the cache are sent to the model
+    items = [_cache_args(*item) for item in items]
+    keys = [_cache_key(*item) for item in items]
+    results = [llm_cache.get(key) for key in keys]
+    misses = [i for i, category in enumerate(results) if category is None]
+
+    # Near-duplicates of earlier requests are answered from the semantic cache
+    vectors = {}
+    if misses:
+        embedded = semantic_cache.embed(
+            get_client(), [_semantic_text(items[i][0], items[i][2]) for i in misses]
+        )
+        for i, vector in zip(misses, embedded):
+            category = semantic_cache.lookup(vector)
+            if category is None:
+                vectors[i] = vector
+            else:
+                llm_cache.put(keys[i], category)
+                results[i] = category
+        misses = list(vectors)
+
+    positions = [misses[i:i + BATCH_SIZE] for i in range(0, len(misses), BATCH_SIZE)]
+    chunks = [[items[i] for i in batch] for batch in positions]
+    all_answers = _run(_request_batches(chunks))
+
+    skipped, answered = [], []
+    for batch, answers in zip(positions, all_answers):
+        for n, i in enumerate(batch, 1):
+            # Labels outside the fixed set are retried with the schema-constrained call
+            if answers.get(n) in CATEGORIES:
+                llm_cache.put(keys[i], answers[n])
+                results[i] = answers[n]
+                answered.append(i)
+            else:
+                skipped.append(i)
+    if answered:
+        semantic_cache.add_many(
+            np.stack([vectors[i] for i in answered]), [results[i] for i in answered]
+        )
+
+    # Anything the model skipped is retried with concurrent single requests
+    if skipped:
+        categories = _run(categorize_many([items[i] for i in skipped]))
+        for i, category in zip(skipped, categories):
+            results[i] = category
+
+    # The async retries only buffer their additions; persist everything once
+    semantic_cache.flush()
+    return results
+
+
+def submit_batch(rows: Iterable[tuple[str, float, str]]) -> str:
+    """Queue ``(description, amount, note)`` rows on OpenAI's Batch API.
+
+    Batch jobs cost about half as much as live requests but may take up to 24
+    hours, which suits end-of-month runs nobody is waiting on. Results are keyed
+    ``row-<n>`` in the order of ``rows``.
+
+    Returns
+    -------
+    str
+        The batch id to pass to ``batch_results`` or ``poll_batch``.
+    """
+
+    rows = [_cache_args(*row) for row in rows]
+    # One embedding call picks the few-shot examples for every row
+    vectors = semantic_cache.embed(get_client(), [_semantic_text(d, n) for d, _, n in rows])
+    return _submit_requests([
+        {
+            "model": "gpt-4o",
+            "input": _single_messages(*row, vector),
+            "text": _CATEGORY_FORMAT,
         }
+        for row, vector in zip(rows, vectors)
+    ])
+
+
+def _submit_requests(bodies: list[dict]) -> str:
+    """Upload Responses API request ``bodies`` as one batch keyed ``row-<n>``."""
+
+    lines = [
+        json.dumps({
+            "custom_id": f"row-{i}",
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": body,
+        })
+        for i, body in enumerate(bodies)
+    ]
+    batch_file = get_client().files.create(
+        file=("requests.jsonl", "\n".join(lines).encode()), purpose="batch"
     )
+    batch = get_client().batches.create(
+        input_file_id=batch_file.id, endpoint="/v1/responses", completion_window="24h"
+    )
+    return batch.id
+
+
+def batch_results(batch_id: str) -> dict[str, str] | None:
+    """Return ``{custom_id: category}`` for a finished batch, or ``None`` if it is still running."""
+
+    texts = _batch_texts(batch_id)
+    if texts is None:
+        return None
+    return {
+        custom_id: _parse_category(text) or "Uncategorized"
+        for custom_id, text in texts.items()
+    }
 
-    # Call the new 'responses' API
-    response = client.responses.create(model="gpt-4o", input=messages)
 
-    # 'response.output_text' should contain the model's final reply
-    return response.output_text.strip()
+def _batch_texts(batch_id: str) -> dict[str, str] | None:
+    """Return ``{custom_id: reply text}`` for a finished batch, or ``None`` if it is still running.
 
+    Requests that errored are left out.
 
-def normalize_payees(payees: list[str]) -> dict[str, str]:
+    Raises
+    ------
+    RuntimeError
+        If the batch failed, expired or was cancelled.
+    """
+
+    batch = get_client().batches.retrieve(batch_id)
+    if batch.status in ("validating", "in_progress", "finalizing"):
+        return None
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+
+    results = {}
+    for line in get_client().files.content(batch.output_file_id).text.splitlines():
+        record = json.loads(line)
+        if record.get("error") or not record.get("response"):
+            continue
+        # Raw response bodies carry the reply as output_text parts of message items
+        body = record["response"]["body"]
+        results[record["custom_id"]] = "".join(
+            part["text"]
+            for item in body.get("output", [])
+            if item.get("type") == "message"
+            for part in item.get("content", [])
+            if part.get("type") == "output_text"
+        )
+    return results
+
+
+def poll_batch(batch_id: str, interval: float = 30.0, max_interval: float = 600.0) -> dict[str, str]:
+    """Block until a batch finishes, backing off between checks, and return its results."""
+
+    while (results := batch_results(batch_id)) is None:
+        time.sleep(interval)
+        interval = min(interval * 2, max_interval)
+    return results
+
+
+# Payees sent per normalization request; long lists degrade the JSON output
+NORMALIZE_BATCH_SIZE = 20
+
+_NORMALIZE_PREFIX = {
+    "role": "developer",
+    "content": (
+        "You clean merchant names for bookkeeping. You will receive numbered payees "
+        "like '[1] ...'. Return a JSON object mapping each number to a concise "
+        "canonical vendor name. Respond ONLY with JSON."
+    ),
+}
+
+
+def normalize_payees(
+    payees: list[str], batch_size: int = NORMALIZE_BATCH_SIZE
+) -> dict[str, str]:
     """Use the LLM to normalize a batch of payee names.
 
     Parameters
     ----------
     payees:
         List of raw payee strings from bank statements.
+    batch_size:
+        Maximum number of payees sent in a single request.
 
     Returns
     -------
@@ -95,28 +615,122 @@ def normalize_payees(payees: list[str]) -> dict[str, str]:
         Mapping of each original payee to a canonical vendor name.
     """
 
-    if not payees:
-        return {}
+    # Recurring charges repeat the same payee; only send each string once
+    uniques = list(dict.fromkeys(payees))
 
-    messages = [
-        {
-            "role": "developer",
-            "content": (
-                "You clean merchant names for bookkeeping. Given a list of payees, "
-                "return a JSON object mapping each original payee string to a "
-                "concise canonical vendor name. Respond ONLY with JSON."
-            ),
-        },
-        {"role": "user", "content": "\n".join(payees)},
+    mapping = {}
+    for start in range(0, len(uniques), batch_size):
+        mapping.update(_normalize_chunk(uniques[start:start + batch_size]))
+    return mapping
+
+
+def submit_payee_batch(payees: list[str], batch_size: int = NORMALIZE_BATCH_SIZE) -> str:
+    """Queue ``normalize_payees`` on the Batch API and return the batch id.
+
+    Pass the same ``payees`` and ``batch_size`` to ``payee_batch_results``.
+    """
+
+    uniques = list(dict.fromkeys(payees))
+    return _submit_requests([
+        {"model": "gpt-4o", "input": _normalize_messages(uniques[start:start + batch_size])}
+        for start in range(0, len(uniques), batch_size)
+    ])
+
+
+def payee_batch_results(
+    batch_id: str, payees: list[str], batch_size: int = NORMALIZE_BATCH_SIZE
+) -> dict[str, str] | None:
+    """Return the ``normalize_payees`` mapping from a finished payee batch.
+
+    Returns ``None`` while the batch is still running. Chunks whose reply is
+    missing or not valid JSON map their payees to themselves; a batch cannot
+    retry them in halves like the live path.
+    """
+
+    texts = _batch_texts(batch_id)
+    if texts is None:
+        return None
+
+    uniques = list(dict.fromkeys(payees))
+    mapping = {}
+    for n, start in enumerate(range(0, len(uniques), batch_size)):
+        chunk = uniques[start:start + batch_size]
+        parsed = _parse_normalized(texts.get(f"row-{n}", ""), chunk)
+        mapping.update(parsed or {p: p for p in chunk})
+    return mapping
+
+
+def _extract_json(text: str):
+    """Return the first JSON object, or array of objects, in ``text``.
+
+    Models sometimes wrap JSON in ```json fences or add a sentence around it;
+    scanning for the first suitable value that decodes tolerates both. Other
+    arrays, such as the "[1]" payee labels echoed back in prose, are skipped.
+    Returns ``None`` when nothing suitable is found.
+    """
+
+    decoder = json.JSONDecoder()
+    for i, char in enumerate(text):
+        if char in "{[":
+            try:
+                value = decoder.raw_decode(text, i)[0]
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict) or (
+                isinstance(value, list) and any(isinstance(item, dict) for item in value)
+            ):
+                return value
+    return None
+
+
+def _normalize_messages(chunk: list[str]) -> list[dict]:
+    return [
+        _NORMALIZE_PREFIX,
+        {"role": "user", "content": "\n".join(f"[{i}] {p}" for i, p in enumerate(chunk, 1))},
     ]
 
-    response = client.responses.create(model="gpt-4o", input=messages)
-    text = response.output_text.strip()
-    try:
-        return json.loads(text)
-    except Exception:
+
+def _normalize_chunk(chunk: list[str]) -> dict[str, str]:
+    """Normalize one chunk of payees, halving it if the reply is not valid JSON."""
+
+    response = get_client().responses.create(model="gpt-4o", input=_normalize_messages(chunk))
+    mapping = _parse_normalized(response.output_text, chunk)
+    if mapping is None:
+        if len(chunk) > 1:
+            half = len(chunk) // 2
+            return {**_normalize_chunk(chunk[:half]), **_normalize_chunk(chunk[half:])}
         # Fallback to identity mapping if parsing fails
-        return {p: p for p in payees}
+        return {p: p for p in chunk}
+    return mapping
+
+
+def _parse_normalized(text: str, chunk: list[str]) -> dict[str, str] | None:
+    """Map each payee in ``chunk`` to its name in a reply, or ``None`` if it has no JSON."""
+
+    parsed = _extract_json(text)
+    if isinstance(parsed, list):
+        # Some replies come back as [{"orig": ..., "canonical": ...}, ...]
+        parsed = {
+            item.get("orig", item.get("payee")): item.get("canonical")
+            for item in parsed
+            if isinstance(item, dict)
+        }
+
+    if not isinstance(parsed, dict):
+        return None
+
+    # Keys are normally the payee numbers, but accept the payee strings too
+    mapping = {}
+    for key, canonical in parsed.items():
+        # Null or non-string answers leave the payee unchanged
+        if not isinstance(key, str) or not isinstance(canonical, str) or not canonical:
+            continue
+        number = key.strip("[] ")
+        if key in chunk:
+            mapping[key] = canonical
+        elif number.isdigit() and 1 <= int(number) <= len(chunk):
+            mapping[chunk[int(number) - 1]] = canonical
+    return {p: mapping.get(p, p) for p in chunk}
 
 
 # import openai
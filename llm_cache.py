@@ -0,0 +1,39 @@
+"""Exact-match cache for LLM answers, persisted in a small SQLite table."""
+
+import os
+import json
+import sqlite3
+import hashlib
+from contextlib import closing
+
+
+# Answers already returned by the model are kept on disk so repeated requests
+# never hit the network again, even across runs.
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite")
+
+
+def make_key(payload: dict) -> str:
+    """Return a stable SHA-256 key for a JSON-serializable request payload."""
+
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _connect():
+    conn = sqlite3.connect(CACHE_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def get(key: str) -> str | None:
+    """Return the cached value for ``key``, or ``None`` on a miss."""
+
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def put(key: str, value: str) -> None:
+    """Store ``value`` under ``key``."""
+
+    with closing(_connect()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?)", (key, value))
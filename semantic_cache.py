@@ -0,0 +1,115 @@
+"""Embedding cache that reuses categories for near-duplicate transactions."""
+
+import os
+import atexit
+import numpy as np
+
+
+# Notes like "coffee w/ client" and "client coffee" should share a category
+# without another chat completion. Vectors and their categories are kept in a
+# small .npz file so the cache survives between runs.
+CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "data/semantic_cache.npz")
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.92
+# The embeddings endpoint caps the number of inputs per request
+EMBED_BATCH_SIZE = 1000
+
+# Loaded lazily and keyed by path. Additions stay in memory until ``flush``:
+# {path: {"vectors": array with spare rows, "values": list, "dirty": bool}}
+_indexes = {}
+
+
+def embed(client, texts: list[str]) -> np.ndarray:
+    """Return unit-length embeddings for ``texts``, one row per text.
+
+    Long lists are split into requests of at most ``EMBED_BATCH_SIZE`` inputs.
+    """
+
+    return _unit_rows([
+        client.embeddings.create(model=EMBEDDING_MODEL, input=chunk)
+        for chunk in _chunks(texts)
+    ])
+
+
+async def aembed(aclient, texts: list[str]) -> np.ndarray:
+    """Async version of ``embed`` for an ``AsyncOpenAI`` client."""
+
+    return _unit_rows([
+        await aclient.embeddings.create(model=EMBEDDING_MODEL, input=chunk)
+        for chunk in _chunks(texts)
+    ])
+
+
+def _chunks(texts):
+    texts = list(texts)
+    return [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+
+
+def _unit_rows(responses) -> np.ndarray:
+    vectors = np.array(
+        [d.embedding for response in responses for d in response.data], dtype=np.float32
+    )
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _load():
+    if CACHE_PATH not in _indexes:
+        try:
+            with np.load(CACHE_PATH) as f:
+                vectors, values = f["vectors"], f["values"].tolist()
+        except FileNotFoundError:
+            vectors, values = None, []
+        _indexes[CACHE_PATH] = {"vectors": vectors, "values": values, "dirty": False}
+    return _indexes[CACHE_PATH]
+
+
+def lookup(vector: np.ndarray) -> str | None:
+    """Return the cached value closest to ``vector`` if it is similar enough."""
+
+    index = _load()
+    values = index["values"]
+    if not values:
+        return None
+
+    # Embeddings are normalized, so the dot product is the cosine similarity
+    sims = index["vectors"][: len(values)] @ vector
+    best = int(np.argmax(sims))
+    return values[best] if sims[best] >= SIMILARITY_THRESHOLD else None
+
+
+def add(vector: np.ndarray, value: str) -> None:
+    """Store ``value`` under ``vector`` in memory; see ``flush``."""
+
+    add_many(vector[None, :], [value])
+
+
+def add_many(vectors: np.ndarray, values: list[str]) -> None:
+    """Store one value per row of ``vectors`` in memory; see ``flush``."""
+
+    index = _load()
+    n, k = len(index["values"]), len(values)
+    store = index["vectors"]
+    # Grow by doubling so repeated adds do not copy the whole matrix each time
+    if store is None or n + k > len(store):
+        grown = np.empty((max(64, 2 * n, n + k), vectors.shape[1]), dtype=np.float32)
+        if store is not None:
+            grown[:n] = store[:n]
+        store = grown
+    store[n:n + k] = vectors
+    index["vectors"] = store
+    index["values"].extend(values)
+    index["dirty"] = True
+
+
+def flush() -> None:
+    """Write caches with unsaved additions to disk, once per batch of adds."""
+
+    for path, index in _indexes.items():
+        if index["dirty"]:
+            n = len(index["values"])
+            np.savez(path, vectors=index["vectors"][:n], values=np.array(index["values"]))
+            index["dirty"] = False
+
+
+# Whatever a run added but did not flush is still saved on exit
+atexit.register(flush)
@@ -1,10 +1,19 @@
 
+import os
 import app
+import llm
 import streamlit as st
 from utils import load_statements
 
 st.title("🧾 Bookkeeping Assistant")
 
+# Stop before any statement is processed rather than failing on every request
+try:
+    llm.get_client()
+except RuntimeError as exc:
+    st.error(str(exc))
+    st.stop()
+
 # Let the user specify whether the uploaded statements are personal or business
 account_type = st.selectbox("Account type", ["business", "personal"])
 
@@ -12,6 +21,40 @@ data = load_statements()
 if data is not None:
     st.write("Data columns:", data.columns)
     st.write(data.head(10))
-    app.main(data, account_type=account_type)
+    # Personal statements never call the model, so there is nothing to batch
+    if account_type == "business" and st.toggle("Submit as batch (cheaper, overnight)"):
+        # Uses OpenAI's Batch API; results arrive within 24 hours
+        if st.button("Submit batch"):
+            batch_id = app.submit_vendor_batch(data, account_type=account_type)
+            if batch_id is None:
+                st.info("All transactions are already categorized.")
+            else:
+                st.success(f"Submitted batch {batch_id}")
+    else:
+        app.main(data, account_type=account_type)
 else:
     st.info("Upload bank statement CSV files to get started.")
+
+# Batches whose transactions have not been saved yet
+pending = (
+    sorted(
+        f.removesuffix(".parquet")
+        for f in os.listdir(app.BATCH_DIR)
+        if f.endswith(".parquet")
+    )
+    if os.path.isdir(app.BATCH_DIR)
+    else []
+)
+batch_id = st.selectbox("Submitted batches", pending, index=None)
+if batch_id and st.button("Save batch results"):
+    try:
+        saved = app.apply_vendor_batch(batch_id)
+    except RuntimeError as exc:
+        # Failed, expired or cancelled batches never produce results
+        st.error(f"{exc}. Resubmit the statements to categorize them.")
+        app.discard_vendor_batch(batch_id)
+    else:
+        if saved is None:
+            st.info("Batch is still running.")
+        else:
+            st.success(f"Saved {saved} transaction(s) from batch {batch_id}.")
@@ -3,9 +3,57 @@ from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+import asyncio
+import io
 import json
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+import app
+import llm
+import semantic_cache
 import utils
-from llm import categorize_expense, normalize_payees
+from app import _txn_key
+from llm import (
+    batch_results,
+    categorize_expense,
+    categorize_expenses_batch,
+    categorize_many,
+    normalize_payees,
+)
+
+
+class DummyEmbedding:
+    def __init__(self, embedding):
+        self.embedding = embedding
+
+
+class DummyEmbeddings:
+    def __init__(self, vectors):
+        self.data = [DummyEmbedding(v) for v in vectors]
+
+
+def fake_embed(model, input):
+    # Deterministic pseudo-random vectors so distinct texts are never similar
+    return DummyEmbeddings(
+        [np.random.default_rng(abs(hash(text))).normal(size=64) for text in input]
+    )
+
+
+async def fake_aembed(model, input):
+    return fake_embed(model, input)
+
+
+@pytest.fixture(autouse=True)
+def isolated_llm_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr("llm_cache.CACHE_PATH", str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setattr("semantic_cache.CACHE_PATH", str(tmp_path / "semantic.npz"))
+    monkeypatch.setattr("llm.client.embeddings.create", fake_embed)
+    monkeypatch.setattr("llm.aclient.embeddings.create", fake_aembed)
+    llm._categorize_cached.cache_clear()
+    llm._example_vectors.cache_clear()
 
 
 def test_amzn_digital_normalization():
@@ -15,17 +63,31 @@ def test_amzn_digital_normalization():
     assert utils.normalize_payee(payee2) == 'AMZN DIGITAL'
 
 
+def test_normalize_payee_caches_strings_only():
+    utils._normalize_payee.cache_clear()
+    assert utils.normalize_payee("UBER  TRIP 01/02") == "UBER TRIP"
+    assert utils.normalize_payee("UBER  TRIP 01/02") == "UBER TRIP"
+    assert utils.normalize_payee(None) is None
+    info = utils._normalize_payee.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
 class DummyResponse:
     def __init__(self, text):
         self.output_text = text
 
 
+def category_response(category):
+    return DummyResponse(json.dumps({"category": category}))
+
+
 def test_llm_called_for_r_and_d(monkeypatch):
     calls = {}
 
-    def fake_create(model, input):
+    def fake_create(model, input, text):
         calls["called"] = True
-        return DummyResponse("Research & Development")
+        assert text["format"]["schema"]["properties"]["category"]["enum"] == list(llm.CATEGORIES)
+        return category_response("Research & Development")
 
     monkeypatch.setattr("llm.client.responses.create", fake_create)
 
@@ -34,6 +96,173 @@ def test_llm_called_for_r_and_d(monkeypatch):
     assert calls.get("called")
 
 
+def test_missing_api_key_fails_before_any_request(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY")
+    llm.get_client.cache_clear()
+    try:
+        with pytest.raises(RuntimeError, match="OPENAI_API_KEY"):
+            categorize_expense("Uber", 50, "Ride to airport")
+    finally:
+        llm.get_client.cache_clear()
+
+
+def test_clients_retry_transient_failures():
+    assert llm.get_client().max_retries == llm.MAX_RETRIES
+    assert llm.get_aclient().max_retries == llm.MAX_RETRIES
+
+
+def test_unparseable_category_reply_is_uncategorized(monkeypatch):
+    monkeypatch.setattr(
+        "llm.client.responses.create",
+        lambda model, input, text: DummyResponse("I can't help with that."),
+    )
+    assert categorize_expense("Uber", 50, "Ride to airport") == "Uncategorized"
+
+
+def test_refusal_is_not_cached(monkeypatch):
+    replies = [DummyResponse("I can't help with that."), category_response("Travel")]
+    monkeypatch.setattr("llm.client.responses.create", lambda model, input, text: replies.pop(0))
+
+    assert categorize_expense("Uber", 50, "Ride to airport") == "Uncategorized"
+    llm._categorize_cached.cache_clear()
+    assert categorize_expense("Uber", 50, "Ride to airport") == "Travel"
+    assert not replies
+
+
+def test_async_refusal_is_not_cached(monkeypatch):
+    replies = [DummyResponse("I can't help with that."), category_response("Travel")]
+
+    async def fake_create(model, input, text):
+        return replies.pop(0)
+
+    monkeypatch.setattr("llm.aclient.responses.create", fake_create)
+    assert asyncio.run(categorize_many([("Uber", 50, "Ride to airport")])) == ["Uncategorized"]
+    assert asyncio.run(categorize_many([("Uber", 50, "Ride to airport")])) == ["Travel"]
+
+
+def test_main_keeps_notes_when_categorization_fails(monkeypatch, tmp_path):
+    def fail(items):
+        raise RuntimeError("API down")
+
+    saved = []
+    monkeypatch.setattr("app.load_existing_table", lambda: pd.DataFrame(
+        {col: pd.Series(dtype=dtype) for col, dtype in utils.TABLE_DTYPES.items()}
+    ))
+    monkeypatch.setattr("app.categorize_expenses_batch", fail)
+    monkeypatch.setattr("app.save_table", lambda df, append=False: saved.append(df))
+    monkeypatch.setattr(
+        "builtins.input", lambda prompt="": "" if "Suggested" in prompt else "ride to client"
+    )
+
+    data = pd.DataFrame(
+        {"payee": ["UBER"], "date": pd.to_datetime(["2024-01-02"]), "amount": [-12.5]}
+    )
+    result = app.main(data)
+    assert result[["note", "category"]].values.tolist() == [["ride to client", "Uncategorized"]]
+    assert len(saved) == 1
+
+
+def test_main_saves_confirmed_rows_when_interrupted(monkeypatch):
+    saved, confirmed = [], []
+
+    def confirm(category):
+        if confirmed:
+            raise KeyboardInterrupt
+        confirmed.append(category)
+        return category
+
+    monkeypatch.setattr("app.load_existing_table", lambda: pd.DataFrame(
+        {col: pd.Series(dtype=dtype) for col, dtype in utils.TABLE_DTYPES.items()}
+    ))
+    monkeypatch.setattr("app.save_table", lambda df, append=False: saved.append(df))
+    monkeypatch.setattr("app.confirm_category", confirm)
+
+    data = pd.DataFrame(
+        {"payee": ["LYFT", "UBER"], "date": pd.to_datetime(["2024-01-02"] * 2),
+         "amount": [-7.0, -12.5]}
+    )
+    with pytest.raises(KeyboardInterrupt):
+        app.main(data, account_type="personal")
+    assert len(saved) == 1
+    assert saved[0]["payee"].tolist() == ["LYFT"]
+
+
+def test_vendor_batch_submits_new_vendors_and_saves_results(monkeypatch, tmp_path):
+    existing = pd.DataFrame(
+        {"payee": ["UBER"], "date": pd.to_datetime(["2024-01-02"]), "amount": [-12.5],
+         "note": [""], "category": ["Travel"]}
+    )
+    submitted, saved, remembered = [], [], []
+    monkeypatch.setattr("app.load_existing_table", lambda: existing.copy())
+    monkeypatch.setattr("app.submit_batch", lambda rows: submitted.extend(rows) or "batch-1")
+    monkeypatch.setattr("app.unknown_payees", lambda payees: sorted(set(payees) - {"UBER"}))
+    monkeypatch.setattr("app.submit_payee_batch", lambda payees: "payees-1")
+    monkeypatch.setattr("app.remember_canonical_payees", remembered.append)
+    monkeypatch.setattr("app.save_table", lambda df, append=False: saved.append(df))
+
+    data = pd.DataFrame(
+        {"payee": ["UBER", "ZOOM.US", "ZOOM.US"],
+         "date": pd.to_datetime(["2024-01-02", "2024-01-03", "2024-02-03"]),
+         "amount": [-12.5, -15.0, -17.0]}
+    )
+    assert app.submit_vendor_batch(data, batch_dir=tmp_path) == "batch-1"
+    assert submitted == [("ZOOM.US", -16.0, "")]
+    assert json.loads((tmp_path / "batch-1.payees.json").read_text()) == {
+        "batch_id": "payees-1", "payees": ["ZOOM.US"]
+    }
+
+    monkeypatch.setattr("app.batch_results", lambda batch_id: None)
+    assert app.apply_vendor_batch("batch-1", tmp_path) is None
+
+    # Rows wait for the payee batch too
+    monkeypatch.setattr("app.batch_results", lambda batch_id: {"row-0": "Software & Subscriptions"})
+    monkeypatch.setattr("app.payee_batch_results", lambda batch_id, payees: None)
+    assert app.apply_vendor_batch("batch-1", tmp_path) is None
+
+    monkeypatch.setattr(
+        "app.payee_batch_results", lambda batch_id, payees: {"ZOOM.US": "Zoom"}
+    )
+    assert app.apply_vendor_batch("batch-1", tmp_path) == 2
+    assert saved[0]["category"].tolist() == ["Software & Subscriptions"] * 2
+    assert remembered == [{"ZOOM.US": "Zoom"}]
+    assert not list(tmp_path.iterdir())
+
+
+def test_personal_vendor_batch_saves_without_submitting(monkeypatch, tmp_path):
+    empty = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in utils.TABLE_DTYPES.items()})
+    saved = []
+    monkeypatch.setattr("app.load_existing_table", lambda: empty.copy())
+    monkeypatch.setattr("app.submit_batch", lambda rows: pytest.fail("submitted"))
+    monkeypatch.setattr("app.save_table", lambda df, append=False: saved.append(df))
+
+    data = pd.DataFrame(
+        {"payee": ["UBER"], "date": pd.to_datetime(["2024-01-02"]), "amount": [-12.5]}
+    )
+    assert app.submit_vendor_batch(data, "personal", tmp_path) is None
+    assert saved[0][["note", "category"]].values.tolist() == [["Personal expense", "PERSONAL"]]
+
+
+def test_payee_batch_results_parse_each_chunk(monkeypatch):
+    texts = {"row-0": '{"1": "Uber", "2": null}', "row-1": "not json"}
+    monkeypatch.setattr("llm._batch_texts", lambda batch_id: texts)
+
+    mapping = llm.payee_batch_results("b", ["UBER TRIP", "LYFT", "ZOOM.US"], batch_size=2)
+    assert mapping == {"UBER TRIP": "Uber", "LYFT": "LYFT", "ZOOM.US": "ZOOM.US"}
+
+
+def test_embed_splits_long_inputs(monkeypatch):
+    sizes = []
+
+    def counting_embed(model, input):
+        sizes.append(len(input))
+        return fake_embed(model, input)
+
+    monkeypatch.setattr("semantic_cache.EMBED_BATCH_SIZE", 2)
+    monkeypatch.setattr("llm.client.embeddings.create", counting_embed)
+    assert semantic_cache.embed(llm.client, list("abcde")).shape == (5, 64)
+    assert sizes == [2, 2, 1]
+
+
 def test_confirm_category_override(monkeypatch):
     monkeypatch.setattr("builtins.input", lambda _: "Software & Subscriptions")
     assert (
@@ -67,3 +296,437 @@ def test_llm_normalizes_payees(monkeypatch):
     assert result[payee1] == "AMZN DIGITAL"
     assert result[payee2] == "AMZN DIGITAL"
     assert calls.get("called")
+
+
+def test_txn_key_matches_row_format():
+    df = pd.DataFrame(
+        {"payee": ["UBER", "LYFT"], "date": ["2024-01-02", "2024-01-03"], "amount": [-12.5, 7.0]}
+    )
+    assert _txn_key(df).tolist() == ["UBER|2024-01-02|-12.5", "LYFT|2024-01-03|7.0"]
+
+
+def test_save_table_append_keeps_disk_column_order(tmp_path):
+    path = tmp_path / "table.csv"
+    utils.save_table(pd.DataFrame({"payee": ["A"], "amount": [1.0]}), path)
+    utils.save_table(pd.DataFrame({"amount": [2.0], "payee": ["B"]}), path, append=True)
+
+    df = pd.read_csv(path)
+    assert df["payee"].tolist() == ["A", "B"]
+    assert df["amount"].tolist() == [1.0, 2.0]
+
+
+def test_csv_appends_match_to_csv_format(tmp_path):
+    path = tmp_path / "table.csv"
+    first = pd.DataFrame(
+        {"payee": ["B"], "date": pd.to_datetime(["2024-01-01"]), "amount": [-2.0],
+         "note": [None], "category": ["Meals"]}
+    )
+    first.to_csv(path, index=False)
+    rows = pd.DataFrame(
+        {"payee": ["A", "C, Inc"], "date": pd.to_datetime(["2024-01-02", None]),
+         "amount": [-1.0, float("nan")], "note": ["x", None], "category": ["Travel"] * 2}
+    )
+    utils.save_table(rows.iloc[:1], path, append=True)
+    utils.save_table(rows.iloc[1:], path, append=True)
+
+    assert path.read_text() == first.to_csv(index=False) + rows.to_csv(index=False, header=False)
+
+
+def test_categorize_expenses_batch_parses_numbered_reply(monkeypatch):
+    calls = []
+
+    async def fake_create(model, input):
+        calls.append(input)
+        return DummyResponse("[1] Travel\n[2] Utilities")
+
+    monkeypatch.setattr("llm.aclient.responses.create", fake_create)
+
+    result = categorize_expenses_batch(
+        [("Uber", 20.0, "Airport ride"), ("AT&T", 70.0, "Internet")]
+    )
+    assert result == ["Travel", "Utilities"]
+    assert len(calls) == 1
+
+
+def test_categorize_expense_uses_cache(monkeypatch):
+    calls = []
+
+    def fake_create(model, input, text):
+        calls.append(input)
+        return category_response("Travel")
+
+    monkeypatch.setattr("llm.client.responses.create", fake_create)
+
+    assert categorize_expense("Uber", 50, "Ride to airport") == "Travel"
+    llm._categorize_cached.cache_clear()
+    assert categorize_expense("Uber", 50.001, " ride to airport ") == "Travel"
+    assert len(calls) == 1
+
+
+def test_semantic_cache_reuses_near_duplicate_note(monkeypatch):
+    calls = []
+
+    def fake_create(model, input, text):
+        calls.append(input)
+        return category_response("Meals & Entertainment")
+
+    def similar_embed(model, input):
+        return DummyEmbeddings([[1.0, 0.0, 0.1] for _ in input])
+
+    monkeypatch.setattr("llm.client.responses.create", fake_create)
+    monkeypatch.setattr("llm.client.embeddings.create", similar_embed)
+
+    assert categorize_expense("Starbucks", 6, "coffee w/ client") == "Meals & Entertainment"
+    assert categorize_expense("Starbucks", 6, "client coffee") == "Meals & Entertainment"
+    assert len(calls) == 1
+
+
+def test_semantic_cache_buffers_additions_until_flush(tmp_path):
+    semantic_cache.add_many(np.eye(3, dtype=np.float32), ["Travel", "Utilities", "Rent"])
+    semantic_cache.add(np.array([0.0, 0.0, 1.0], dtype=np.float32), "Rent")
+    assert not (tmp_path / "semantic.npz").exists()
+    assert semantic_cache.lookup(np.array([0.0, 1.0, 0.0])) == "Utilities"
+
+    semantic_cache.flush()
+    with np.load(tmp_path / "semantic.npz") as f:
+        assert f["vectors"].shape == (4, 3)
+        assert f["values"].tolist() == ["Travel", "Utilities", "Rent", "Rent"]
+
+
+def test_canonical_payees_only_sends_new_payees(monkeypatch, tmp_path):
+    sent = []
+
+    def fake_normalize(payees):
+        sent.append(payees)
+        return {p: p.title() for p in payees}
+
+    monkeypatch.setattr("utils.llm_normalize_payees", fake_normalize)
+    path = tmp_path / "payees.json"
+
+    assert utils.canonical_payees(["UBER", "LYFT"], path) == {"UBER": "Uber", "LYFT": "Lyft"}
+    assert utils.canonical_payees(["UBER", "ZOOM"], path) == {"UBER": "Uber", "ZOOM": "Zoom"}
+    assert sent == [["LYFT", "UBER"], ["ZOOM"]]
+
+
+def test_load_existing_table_collapses_canonical_payees(monkeypatch, tmp_path):
+    mapping = {"UBER TRIP": "Uber", "UBER EATS": "Uber"}
+    monkeypatch.setattr("utils.canonical_payees", lambda payees: mapping)
+    path = tmp_path / "table.parquet"
+    payees = ["UBER TRIP", "UBER EATS", None, "LYFT"]
+    utils.save_table(pd.DataFrame({"payee": payees, "date": "2024-01-02", "amount": -1.0}), path)
+
+    df = utils.load_existing_table(path)
+    assert df["normalized_payee"].tolist()[:2] == ["Uber", "Uber"]
+    assert pd.isna(df["normalized_payee"][2])
+    assert df["normalized_payee"][3] == "LYFT"
+    assert sorted(df["normalized_payee"].cat.categories) == ["LYFT", "Uber"]
+
+
+def test_null_canonical_names_fall_back_to_payee(monkeypatch, tmp_path):
+    canonical_payees = utils.canonical_payees
+    monkeypatch.setattr(
+        "utils.canonical_payees", lambda payees: canonical_payees(payees, tmp_path / "payees.json")
+    )
+    monkeypatch.setattr(
+        "utils.llm_normalize_payees", lambda payees: {"UBER TRIP": None, "LYFT": ""}
+    )
+    path = tmp_path / "table.parquet"
+    rows = pd.DataFrame({"payee": ["UBER TRIP", "LYFT"]})
+    utils.save_table(rows.assign(date="2024-01-02", amount=-1.0), path)
+
+    df = utils.load_existing_table(path)
+    assert df["normalized_payee"].tolist() == ["UBER TRIP", "LYFT"]
+    cached = json.loads((tmp_path / "payees.json").read_text())
+    assert cached == {"LYFT": "LYFT", "UBER TRIP": "UBER TRIP"}
+
+    # A cache written before the fix still loads
+    (tmp_path / "payees.json").write_text('{"LYFT": null, "UBER TRIP": "Uber"}')
+    utils.save_table(rows.assign(date="2024-01-03", amount=-2.0), path, append=True)
+    df = utils.load_existing_table(path)
+    assert df["normalized_payee"].tolist() == ["Uber", "LYFT"] * 2
+
+    renamed = utils._rename_categories(pd.Categorical(["a", "b", None]), ["A", np.nan])
+    assert list(renamed) == ["A", "b", np.nan]
+
+
+def test_parquet_table_round_trip_and_append(monkeypatch, tmp_path):
+    monkeypatch.setattr("utils.canonical_payees", lambda payees: {})
+    path = tmp_path / "table.parquet"
+    row = {"payee": "UBER", "date": "2024-01-02", "amount": -12.5, "note": "Ride", "category": "Travel"}
+    utils.save_table(pd.DataFrame([row]), path)
+    utils.save_table(pd.DataFrame([{**row, "payee": "LYFT"}]), path, append=True)
+
+    df = utils.load_existing_table(path)
+    assert df["payee"].tolist() == ["UBER", "LYFT"]
+    assert pd.api.types.is_datetime64_any_dtype(df["date"])
+
+
+def test_normalize_payee_column_matches_scalar():
+    payees = pd.Series(
+        [
+            'AMZN Digital*GM3C83WE 888-802-3080 WA        09/30',
+            "PAYPAL           INST XFER  GODADDY.COM     WEB ID: PAYPALSI77",
+            None,
+            "Starbucks  Store 12  01/02",
+        ]
+    )
+    result = utils.normalize_payee_column(payees)
+    assert result[[0, 1, 3]].tolist() == [utils.normalize_payee(payees[i]) for i in (0, 1, 3)]
+    assert pd.isna(result[2])
+
+
+def test_normalize_payee_series_matches_scalar():
+    payees = pd.Series(
+        [
+            "PAYPAL *INST XFER  X  ACME CO   01/02",
+            "VENMO 01/02",
+            "Cash App  x  Joe 12/12",
+            "amazon digital svcs",
+            "  uber   trip  ",
+            "Straße Café",
+            "UBER TRIP\xa001/02",
+            "ACME\xa0\xa0STORE",
+            "UBER 01/02\n",
+            "VENMO\xa0\xa0X\xa0\xa0JOE\xa001/02",
+            None,
+        ]
+    )
+    result = utils.normalize_payee_series(payees)
+    assert result[:10].tolist() == [utils.normalize_payee(p) for p in payees[:10]]
+    assert result[5:10].tolist() == ["STRASSE CAFÉ", "UBER TRIP", "ACME STORE", "UBER", "JOE"]
+    assert result[10] is None
+
+
+def test_normalize_payees_chunks_and_retries(monkeypatch):
+    replies = iter(["not json", '{"1": "Uber"}', '{"1": "Lyft"}', '{"[1]": "Zoom"}'])
+    sent = []
+
+    def fake_create(model, input):
+        sent.append(input[-1]["content"])
+        return DummyResponse(next(replies))
+
+    monkeypatch.setattr("llm.client.responses.create", fake_create)
+
+    result = normalize_payees(["UBER 01/02", "LYFT RIDE", "UBER 01/02", "ZOOM.US"], batch_size=2)
+    assert result == {"UBER 01/02": "Uber", "LYFT RIDE": "Lyft", "ZOOM.US": "Zoom"}
+    assert sent == ["[1] UBER 01/02\n[2] LYFT RIDE", "[1] UBER 01/02", "[1] LYFT RIDE", "[1] ZOOM.US"]
+
+
+def test_categorize_expenses_batch_accepts_itertuples(monkeypatch):
+    async def fake_create(model, input):
+        return DummyResponse("[2] Utilities\n[1] Travel")
+
+    monkeypatch.setattr("llm.aclient.responses.create", fake_create)
+
+    df = pd.DataFrame(
+        {"payee": ["Uber", "AT&T"], "amount": [20.0, 70.0], "note": ["Airport ride", "Internet"]}
+    )
+    rows = df[["payee", "amount", "note"]].itertuples(index=False)
+    assert categorize_expenses_batch(rows) == ["Travel", "Utilities"]
+
+
+def test_batch_answers_outside_categories_are_retried(monkeypatch):
+    singles = []
+
+    async def fake_create(model, input, text=None):
+        if text is None:
+            return DummyResponse("[1] Travel\n[2] Internet stuff")
+        singles.append(input[-1]["content"])
+        return category_response("Utilities")
+
+    monkeypatch.setattr("llm.aclient.responses.create", fake_create)
+
+    rows = [("Uber", 20.0, "Airport ride"), ("AT&T", 70.0, "Internet")]
+    assert categorize_expenses_batch(rows) == ["Travel", "Utilities"]
+    assert len(singles) == 1
+
+
+def test_categorize_many_runs_single_requests(monkeypatch):
+    async def fake_create(model, input, text):
+        return category_response("Travel" if "Uber" in input[-1]["content"] else "Utilities")
+
+    monkeypatch.setattr("llm.aclient.responses.create", fake_create)
+
+    rows = [("Uber", 20.0, "Airport ride"), ("AT&T", 70.0, "Internet")]
+    assert asyncio.run(categorize_many(rows, concurrency=2)) == ["Travel", "Utilities"]
+
+
+def test_batch_results_parses_response_bodies(monkeypatch):
+    record = {
+        "custom_id": "row-0",
+        "response": {
+            "body": {
+                "output": [
+                    {"type": "message", "content": [{"type": "output_text", "text": '{"category": "Travel"}'}]}
+                ]
+            }
+        },
+        "error": None,
+    }
+    batch = SimpleNamespace(status="completed", output_file_id="file-1")
+    monkeypatch.setattr("llm.client.batches.retrieve", lambda batch_id: batch)
+    monkeypatch.setattr(
+        "llm.client.files.content", lambda file_id: SimpleNamespace(text=json.dumps(record))
+    )
+
+    assert batch_results("batch-1") == {"row-0": "Travel"}
+
+    batch.status = "in_progress"
+    assert batch_results("batch-1") is None
+
+
+def test_categorize_prompt_prefix_is_identical_across_calls(monkeypatch):
+    prompts = []
+
+    def fake_create(model, input, text):
+        prompts.append(input)
+        return category_response("Travel")
+
+    monkeypatch.setattr("llm.client.responses.create", fake_create)
+
+    categorize_expense("Uber", 50, "Airport ride")
+    categorize_expense("Delta", 420, "Flight to conference")
+    assert prompts[0][0] == prompts[1][0]
+    assert prompts[0][0]["content"] == prompts[0][0]["content"].strip()
+
+
+def test_categorize_sends_nearest_examples(monkeypatch):
+    prompts = []
+
+    def fake_create(model, input, text):
+        prompts.append(input)
+        return category_response("Travel")
+
+    def keyword_embed(model, input):
+        return DummyEmbeddings([[1.0, 0.0] if "uber" in t.lower() else [0.0, 1.0] for t in input])
+
+    monkeypatch.setattr("llm.client.responses.create", fake_create)
+    monkeypatch.setattr("llm.client.embeddings.create", keyword_embed)
+
+    categorize_expense("Uber", 35, "Ride to client meeting")
+    shots = prompts[0][1:-1]
+    assert len(shots) == 2 * llm.FEW_SHOT_K
+    assert "Uber LTD" in shots[-2]["content"]
+    assert json.loads(shots[-1]["content"]) == {"category": "Travel"}
+
+
+def test_normalize_bank_data_parses_chase_export():
+    csv = (
+        "Details,Posting Date,Description,Amount,Type,Balance,Check or Slip #\n"
+        'DEBIT,12/31/2024,"UBER   TRIP",-12.50,ACH_DEBIT,100.00,,\n'
+        "DEBIT,not a date,BROKEN,-1.00,ACH_DEBIT,99.00,,\n"
+    )
+    raw = pd.read_csv(io.StringIO(csv), index_col=False)
+    df = utils.normalize_bank_data(raw)
+
+    assert df["payee"].tolist() == ["UBER   TRIP"]
+    assert df["date"].tolist() == [pd.Timestamp("2024-12-31")]
+    assert df["amount"].tolist() == [-12.5]
+    assert list(raw.columns)[:2] == ["Details", "Posting Date"]
+    with pytest.raises(ValueError, match="amount"):
+        utils.normalize_bank_data(raw.drop(columns=["Amount"]))
+
+
+def test_normalize_bank_data_sniffs_date_format():
+    raw = pd.DataFrame(
+        [["DEBIT", d, "UBER", -1.0, "ACH_DEBIT", 0.0, None, None] for d in ("2024-12-31", "junk")],
+        columns=["details", "date", "payee", "amount", "type", "balance", "check_num", "na"],
+    )
+    df = utils.normalize_bank_data(raw)
+    assert df["date"].tolist() == [pd.Timestamp("2024-12-31")]
+    assert utils._guess_date_format(pd.Series(["31/12/2024"])) == "%d/%m/%Y"
+
+
+def test_read_statements_matches_pandas_reader():
+    csv = (
+        b"Details,Posting Date,Description,Amount,Type,Balance,Check or Slip #\n"
+        b'DEBIT,12/31/2024,"UBER   TRIP",-12.50,ACH_DEBIT,100.00,,\n'
+        b'CREDIT,12/30/2024,"PAYROLL",500.00,ACH_CREDIT,112.50,,\n'
+    )
+    fast = utils.normalize_bank_data(utils.read_statements([io.BytesIO(csv)]))
+    slow = utils.normalize_bank_data(pd.read_csv(io.BytesIO(csv), index_col=False))
+
+    pd.testing.assert_frame_equal(fast, slow)
+    assert fast["details"].tolist() == ["DEBIT", "CREDIT"]
+
+    # Same fields in another order are matched by header name
+    reordered = (
+        b"Posting Date,Description,Amount,Details,Type,Balance,Check or Slip #\n"
+        b'12/31/2024,"UBER   TRIP",-12.50,DEBIT,ACH_DEBIT,100.00,,\n'
+        b'12/30/2024,"PAYROLL",500.00,CREDIT,ACH_CREDIT,112.50,,\n'
+    )
+    fast = utils.normalize_bank_data(utils.read_statements([io.BytesIO(reordered)]))
+    pd.testing.assert_frame_equal(fast, slow)
+
+
+def test_load_existing_table_cached_until_file_changes(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr("utils.canonical_payees", lambda payees: calls.append(payees) or {})
+    path = tmp_path / "cached.parquet"
+    row = {"payee": "UBER", "date": "2024-01-02", "amount": -12.5, "note": "Ride", "category": "Travel"}
+    utils.save_table(pd.DataFrame([row]), path)
+
+    utils.load_existing_table(path)
+    utils.load_existing_table(path)
+    assert len(calls) == 1
+
+    utils.save_table(pd.DataFrame([row]), path, append=True)
+    assert len(utils.load_existing_table(path)) == 2
+    assert len(calls) == 2
+
+
+def test_empty_table_is_typed_and_csv_migrates(monkeypatch, tmp_path):
+    monkeypatch.setattr("utils.canonical_payees", lambda payees: {})
+    empty = utils.load_existing_table(tmp_path / "missing.parquet")
+    assert empty["amount"].dtype == "float64"
+    assert pd.api.types.is_datetime64_any_dtype(empty["date"])
+
+    csv_path = tmp_path / "table.csv"
+    pd.DataFrame([{"payee": "UBER", "date": "2024-01-02", "amount": -1.0}]).to_csv(csv_path, index=False)
+    df = utils.load_existing_table(tmp_path / "table.parquet")
+    assert (tmp_path / "table.parquet").exists()
+    assert df["payee"].tolist() == ["UBER"]
+    assert isinstance(df["payee"].dtype, pd.CategoricalDtype)
+    assert not utils.migrate_csv_table(csv_path, tmp_path / "table.parquet")
+
+
+def test_read_table_csv_parses_known_types(tmp_path):
+    path = tmp_path / "table.csv"
+    path.write_text("payee,date,amount,note,category\nUBER,2024-01-02,-1,,Travel\n")
+    df = utils.read_table_csv(path)
+    assert pd.api.types.is_datetime64_any_dtype(df["date"])
+    assert df["amount"].dtype == "float64"
+    assert df["category"].tolist() == ["Travel"]
+    assert pd.isna(df["note"][0])
+
+
+def test_normalize_payees_tolerates_fenced_and_list_replies(monkeypatch):
+    replies = iter([
+        'Here you go:\n```json\n{"1": "Uber", "2": "Lyft"}\n```',
+        '[{"orig": "ZOOM.US", "canonical": "Zoom"}]',
+    ])
+    monkeypatch.setattr(
+        "llm.client.responses.create", lambda model, input: DummyResponse(next(replies))
+    )
+
+    assert normalize_payees(["UBER 01/02", "LYFT RIDE", "ZOOM.US"], batch_size=2) == {
+        "UBER 01/02": "Uber",
+        "LYFT RIDE": "Lyft",
+        "ZOOM.US": "Zoom",
+    }
+
+
+def test_normalize_payees_skips_echoed_labels_and_null_names(monkeypatch):
+    replies = iter([
+        'Mapping for [1] and [2]:\n{"1": "Uber", "2": null}',
+        '[{"canonical": "Zoom"}, {"orig": "ZOOM.US", "canonical": null}]',
+    ])
+    monkeypatch.setattr(
+        "llm.client.responses.create", lambda model, input: DummyResponse(next(replies))
+    )
+
+    assert normalize_payees(["UBER 01/02", "LYFT RIDE", "ZOOM.US"], batch_size=2) == {
+        "UBER 01/02": "Uber",
+        "LYFT RIDE": "LYFT RIDE",
+        "ZOOM.US": "ZOOM.US",
+    }
@@ -1,6 +1,16 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
+import io
+import csv
+import os
 import re
+import json
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 from llm import normalize_payees as llm_normalize_payees
 
 
@@ -11,10 +21,8 @@ def load_statements():
         "Upload Bank Statements (CSV)", accept_multiple_files=True
     )
     if uploaded_files:
-        dfs = [pd.read_csv(f) for f in uploaded_files]
-        data = pd.concat(dfs, ignore_index=True)
-        st.write(f"{len(data)} rows loaded from {len(uploaded_files)} files.")
-        normed_data = normalize_bank_data(data)
+        normed_data = _parse_statements(tuple(f.getvalue() for f in uploaded_files))
+        st.write(f"{len(normed_data)} rows loaded from {len(uploaded_files)} files.")
         st.write(f"Columns in normalized data: {normed_data.columns}")
         return normed_data
 
@@ -22,63 +30,349 @@ def load_statements():
     return None
 
 
-def save_table(df, path="data/output_table.csv"):
-    """Persist the categorized transactions to disk."""
+@st.cache_data(show_spinner=False)
+def _parse_statements(contents):
+    """Parse and normalize uploaded statements; cached on the file contents."""
 
-    df.to_csv(path, index=False)
+    return normalize_bank_data(read_statements([io.BytesIO(c) for c in contents]))
 
 
-def load_existing_table(path="data/output_table.csv"):
-    """Return the existing categorized transactions table, if it exists."""
+def read_statements(files):
+    """Read and concatenate bank statement CSVs.
+
+    Statements are parsed with pyarrow's reader, several files at once, keeping
+    each file's own header names, and converted to pandas once. Files pyarrow
+    cannot parse fall back to ``pd.read_csv``.
+    """
 
     try:
-        df = pd.read_csv(path)
-    except FileNotFoundError:
-        df = pd.DataFrame(
-            columns=["payee", "date", "amount", "note", "category"]
+        # A monthly statement fits in one block, so pyarrow parses each file on
+        # a single thread; reading the files concurrently uses the other cores
+        with ThreadPoolExecutor(max_workers=min(8, len(files) or 1)) as pool:
+            tables = list(pool.map(_read_statement, files))
+        return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+    except pa.ArrowInvalid:
+        for f in files:
+            f.seek(0)
+        # index_col=False keeps the trailing comma from shifting every field
+        return pd.concat([pd.read_csv(f, index_col=False) for f in files], ignore_index=True)
+
+
+def _read_statement(f):
+    """Read one statement with pyarrow, naming columns from its header row."""
+
+    header = next(csv.reader([f.readline().decode("utf-8-sig")]))
+    # Chase rows end with a trailing comma: one unnamed field beyond the header
+    for names in (header + ["na"], header):
+        f.seek(0)
+        read_options = pacsv.ReadOptions(column_names=names, skip_rows=1, block_size=8 << 20)
+        try:
+            return pacsv.read_csv(f, read_options=read_options)
+        except pa.ArrowInvalid:
+            continue
+    raise pa.ArrowInvalid("statement rows do not match the header")
+
+
+# Canonical vendor names returned by the LLM, reused across runs
+PAYEE_CACHE_PATH = "data/payee_canonical.json"
+
+
+# The categorized table is stored as Parquet; CSV paths are still accepted
+OUTPUT_PATH = "data/output_table.parquet"
+
+# Columns read back from disk. normalized_payee and transaction_key are
+# recomputed on load, so they are not read.
+TABLE_COLUMNS = ["payee", "date", "amount", "note", "category"]
+TABLE_DTYPES = {
+    "payee": "object",
+    "date": "datetime64[ns]",
+    "amount": "float64",
+    "note": "object",
+    "category": "object",
+}
+
+
+def read_table_csv(path) -> pd.DataFrame:
+    """Read a categorized table saved as CSV.
+
+    Uses pyarrow's multithreaded parser with the known column types, falling
+    back to the default engine for files it cannot handle.
+    """
+
+    dtypes = {col: dtype for col, dtype in TABLE_DTYPES.items() if col != "date"}
+    try:
+        return pd.read_csv(path, engine="pyarrow", dtype=dtypes, parse_dates=["date"])
+    except (ValueError, pa.ArrowInvalid):
+        return pd.read_csv(path)
+
+
+def save_table(df, path=OUTPUT_PATH, append=False):
+    """Persist the categorized transactions to disk.
+
+    Tables are written as zstd-compressed Parquet unless ``path`` ends in
+    ``.csv``. With ``append=True`` the rows in ``df`` are added to the end of an
+    existing table; a CSV is appended in place without rewriting the file.
+    """
+
+    path = str(path)
+    if path.endswith(".csv"):
+        if append and os.path.exists(path):
+            # Match the column order already on disk so appended rows line up
+            columns = pd.read_csv(path, nrows=0).columns
+            _write_csv(df.reindex(columns=columns), path, header=False)
+        else:
+            _write_csv(df, path)
+        return
+
+    if append and os.path.exists(path):
+        df = pd.concat([pd.read_parquet(path), df], ignore_index=True)
+    if "date" in df.columns:
+        df = df.assign(date=pd.to_datetime(df["date"], errors="coerce"))
+    df.to_parquet(path, engine="pyarrow", compression="zstd", index=False)
+
+
+def _write_csv(df, path, header=True):
+    """Write ``df`` with pyarrow's CSV writer, appending when ``header`` is false.
+
+    Values are formatted as ``DataFrame.to_csv`` would: dates without a time of
+    day, floats like ``-2.0`` and no quotes. Rows appended to a table written by
+    ``to_csv`` then look the same. Frames pyarrow cannot write that way (e.g.
+    values that need quoting, or mixed-type object columns) are written with
+    ``to_csv`` instead.
+    """
+
+    # Format into memory first so a failure never leaves a half-written file
+    buf = pa.BufferOutputStream()
+    try:
+        table = pa.Table.from_pandas(_csv_text(df), preserve_index=False)
+        # pyarrow always quotes the header, so it is written separately below
+        pacsv.write_csv(
+            table,
+            buf,
+            write_options=pacsv.WriteOptions(include_header=False, quoting_style="none"),
         )
+    except pa.ArrowException:
+        df.to_csv(path, mode="w" if header else "a", header=header, index=False)
+        return
+    with open(path, "w" if header else "a", newline="") as f:
+        if header:
+            csv.writer(f, lineterminator="\n").writerow(df.columns)
+        f.flush()
+        f.buffer.write(buf.getvalue())
+
+
+def _csv_text(df):
+    """Return ``df`` with float and datetime columns formatted like ``to_csv``."""
+
+    columns = {}
+    for name, col in df.items():
+        if pd.api.types.is_float_dtype(col):
+            # numpy's shortest round-trip repr, which is what to_csv writes
+            text = col.to_numpy(dtype=float, na_value=np.nan).astype(str)
+            columns[name] = pd.Series(text, index=col.index).where(col.notna())
+        elif pd.api.types.is_datetime64_any_dtype(col):
+            midnight = ((col.dt.normalize() == col) | col.isna()).all()
+            columns[name] = col.dt.strftime("%Y-%m-%d" if midnight else "%Y-%m-%d %H:%M:%S")
+        else:
+            columns[name] = col
+    return pd.DataFrame(columns, index=df.index)
+
+
+def migrate_csv_table(csv_path, parquet_path=OUTPUT_PATH):
+    """Convert a table saved as CSV by earlier versions to Parquet, once.
+
+    Returns ``True`` if a table was migrated.
+    """
+
+    if os.path.exists(parquet_path) or not os.path.exists(csv_path):
+        return False
+    save_table(read_table_csv(csv_path), parquet_path)
+    return True
+
+
+def load_existing_table(path=OUTPUT_PATH):
+    """Return the existing categorized transactions table, if it exists.
+
+    The result is cached until the file on disk changes, so Streamlit reruns
+    skip both the read and the LLM payee normalization.
+    """
+
+    path = str(path)
+    if not path.endswith(".csv") and not os.path.exists(path):
+        migrate_csv_table(os.path.splitext(path)[0] + ".csv", path)
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    return _load_existing_table(path, mtime)
+
+
+@st.cache_data(show_spinner=False)
+def _load_existing_table(path, mtime):
+    """Read and normalize the table at ``path``; ``mtime`` only keys the cache."""
+
+    if path.endswith(".csv"):
+        read = read_table_csv
+    else:
+        def read(path):
+            columns = [c for c in TABLE_COLUMNS if c in pq.read_schema(path).names]
+            return pd.read_parquet(path, columns=columns)
+
+    try:
+        df = read(path)
+    except FileNotFoundError:
+        # Typed empty columns so later concatenation does not upcast to object
+        df = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in TABLE_DTYPES.items()})
 
     # Ensure the normalized_payee column exists for downstream grouping
     if "payee" in df.columns:
-        df["normalized_payee"] = df["payee"].apply(normalize_payee)
+        # Normalize the distinct payees (the categories), not every row
+        payees = df["payee"].astype("category").array
+        normalized = _rename_categories(
+            payees, normalize_payee_series(pd.Series(payees.categories))
+        )
         # Use the LLM to further collapse payee variants across the table
-        mapping = llm_normalize_payees(df["normalized_payee"].unique().tolist())
-        df["normalized_payee"] = df["normalized_payee"].replace(mapping)
+        mapping = canonical_payees(normalized.categories.tolist())
+        df["normalized_payee"] = _rename_categories(
+            normalized, [mapping.get(c, c) for c in normalized.categories]
+        )
     else:
         df["normalized_payee"] = ""
 
+    # Repeated strings become integer codes: less memory, faster groupby and remaps
+    for col in ("payee", "normalized_payee", "category", "note"):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
     return df
 
 
+def _rename_categories(values: pd.Categorical, renamed) -> pd.Categorical:
+    """Return ``values`` with categories renamed, merging any that now coincide.
+
+    Only the categories and the integer codes are touched, so the cost depends
+    on the number of distinct values plus one gather over the codes.
+    """
+
+    # Missing new names keep the original category
+    renamed = pd.Index(renamed, dtype=object)
+    renamed = renamed.where(renamed.notna(), values.categories)
+    categories = renamed.unique()
+    codes = np.append(categories.get_indexer(renamed), -1)[values.codes]
+    return pd.Categorical.from_codes(codes, categories)
+
+
+def canonical_payees(payees, path=PAYEE_CACHE_PATH):
+    """Return a mapping of payees to canonical vendor names.
+
+    Results are remembered in a JSON file so only payees that have never been
+    seen before are sent to the LLM.
+    """
+
+    new = unknown_payees(payees, path)
+    if new:
+        mapping = llm_normalize_payees(new)
+        remember_canonical_payees({p: mapping.get(p) for p in new}, path)
+
+    cached = _read_payee_cache(path)
+    return {p: _canonical_name(cached[p], p) for p in payees if p in cached}
+
+
+def unknown_payees(payees, path=PAYEE_CACHE_PATH):
+    """Return the distinct payees with no remembered canonical name, sorted."""
+
+    return sorted({p for p in payees if isinstance(p, str)} - _read_payee_cache(path).keys())
+
+
+def remember_canonical_payees(mapping, path=PAYEE_CACHE_PATH):
+    """Add ``{payee: canonical name}`` pairs to the JSON cache at ``path``."""
+
+    cached = _read_payee_cache(path)
+    # Only non-empty names are kept; anything else maps a payee to itself
+    cached.update({p: _canonical_name(name, p) for p, name in mapping.items()})
+    with open(path, "w") as f:
+        json.dump(cached, f, indent=2, sort_keys=True)
+
+
+def _read_payee_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _canonical_name(name, payee):
+    return name if isinstance(name, str) and name else payee
+
+
+# Statement headers (lower-cased) that differ from the names used in the app
+_BANK_COLUMN_MAP = {
+    "posting date": "date",
+    "description": "payee",
+    "check or slip #": "check_num",
+}
+
+# Columns kept from a statement, required ones first
+_REQUIRED_BANK_COLUMNS = ["date", "payee", "amount"]
+_OPTIONAL_BANK_COLUMNS = ["details", "type", "balance"]
+
+
+# Date layouts seen in bank exports; ambiguous samples resolve to the earliest
+DATE_FORMATS = ["%m/%d/%Y", "%Y-%m-%d", "%m/%d/%y", "%d/%m/%Y"]
+
+
+def _guess_date_format(dates: pd.Series) -> str:
+    """Return the entry of ``DATE_FORMATS`` that parses most of a small sample.
+
+    Falls back to ``"mixed"`` (per-element inference) when none of them fit.
+    """
+
+    sample = dates.dropna().astype(str).head(20)
+    counts = {
+        fmt: pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()
+        for fmt in DATE_FORMATS
+    }
+    best = max(counts, key=counts.get)
+    return best if counts[best] else "mixed"
+
+
 def normalize_bank_data(df):
     """Normalize raw bank statement columns to the expected schema."""
 
-    df.reset_index(inplace=True)
-    df.columns = [
-        "details",
-        "date",
-        "payee",
-        "amount",
-        "type",
-        "balance",
-        "check_num",
-        "na",
-    ]
-    df.drop(columns=["na", "check_num"], inplace=True)
+    # Match columns by name, not position, so other layouts fail loudly here
+    df = df.rename(
+        columns=lambda c: _BANK_COLUMN_MAP.get(str(c).strip().lower(), str(c).strip().lower())
+    )
 
     # Make sure required columns are present
-    for col in ["date", "payee", "amount"]:
+    for col in _REQUIRED_BANK_COLUMNS:
         if col not in df.columns:
             raise ValueError(f"Missing required column: {col}")
+    df = df[_REQUIRED_BANK_COLUMNS + [c for c in _OPTIONAL_BANK_COLUMNS if c in df.columns]]
 
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date", "payee", "amount"])
+    # An explicit format takes the fast strptime path instead of per-row inference
+    df["date"] = pd.to_datetime(
+        df["date"], format=_guess_date_format(df["date"]), errors="coerce"
+    )
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
+    # One combined mask over the required columns, applied with a single take
+    keep = df["date"].notna().to_numpy() & df["payee"].notna().to_numpy()
+    keep &= df["amount"].notna().to_numpy()
+    df = df[keep]
 
     return df
 
 
 AGGREGATOR_KEYWORDS = ["PAYPAL", "VENMO", "CASH APP", "ZELLE"]
 
+# Patterns used by normalize_payee, compiled once at import
+_RE_TRAIL_DATE = re.compile(r"\s+\d{2}/\d{2}$")
+_RE_MULTI_SPACE = re.compile(r"\s{2,}")
+# Same prefix test as str.startswith, so no \b: "PAYPALSI..." still matches
+_RE_AGGREGATOR = re.compile("^(" + "|".join(map(re.escape, AGGREGATOR_KEYWORDS)) + ")")
+
 
 def normalize_payee(payee: str) -> str:
     """Return a normalized version of a payee string for grouping.
@@ -90,30 +384,73 @@ def normalize_payee(payee: str) -> str:
 
     if not isinstance(payee, str):
         return payee
+    return _normalize_payee(payee)
+
 
+# Statements repeat the same payee strings many times, so scalar callers hit
+# the cache instead of re-running the regexes
+@functools.lru_cache(maxsize=100_000)
+def _normalize_payee(payee: str) -> str:
     payee = payee.upper()
 
     # Remove trailing dates like MM/DD for grouping
-    payee_no_date = re.sub(r"\s+\d{2}/\d{2}$", "", payee)
+    payee_no_date = _RE_TRAIL_DATE.sub("", payee)
 
     # Attempt to extract vendor from aggregator services before collapsing spaces
-    for keyword in AGGREGATOR_KEYWORDS:
-        if payee_no_date.startswith(keyword):
-            parts = re.split(r"\s{2,}", payee)
-            if len(parts) >= 3:
-                candidate = re.sub(r"\s+\d{2}/\d{2}$", "", parts[2])
-                return candidate.strip()
-            return keyword
+    match = _RE_AGGREGATOR.match(payee_no_date)
+    if match:
+        parts = _RE_MULTI_SPACE.split(payee)
+        if len(parts) >= 3:
+            candidate = _RE_TRAIL_DATE.sub("", parts[2])
+            return candidate.strip()
+        return match.group(1)
 
     # Normalize Amazon Digital purchases which include random codes and phone numbers
     if payee_no_date.startswith(("AMZN DIGITAL", "AMAZON DIGITAL")):
         return "AMZN DIGITAL"
 
     # Collapse multiple spaces for general normalization
-    payee_no_date = re.sub(r"\s{2,}", " ", payee_no_date)
+    payee_no_date = _RE_MULTI_SPACE.sub(" ", payee_no_date)
     return payee_no_date.strip()
 
 
+def normalize_payee_series(payees: pd.Series) -> pd.Series:
+    """Vectorized ``normalize_payee`` over a whole Series.
+
+    Each rule runs once across the column with the ``.str`` accessor instead of
+    once per row in Python. Missing values are returned unchanged.
+    """
+
+    # Arrow-backed strings send strip/startswith to pyarrow's UTF-8 kernels.
+    # Upper-casing and the regex replaces stay in Python so results match
+    # ``normalize_payee``: pyarrow skips special casing ("ß" stays "ß") and its
+    # RE2 engine reads \s and \d as ASCII-only and $ as the very end of the
+    # string. Compiled patterns make pandas use ``re`` for the replaces.
+    upper = payees.astype("string").str.upper().astype("string[pyarrow]")
+    no_date = upper.str.replace(_RE_TRAIL_DATE, "", regex=True)
+    result = no_date.str.replace(_RE_MULTI_SPACE, " ", regex=True).str.strip()
+
+    # Normalize Amazon Digital purchases which include random codes and phone numbers
+    amazon = no_date.str.startswith(("AMZN DIGITAL", "AMAZON DIGITAL"), na=False)
+    result = result.mask(amazon, "AMZN DIGITAL")
+
+    # Aggregators keep the vendor in the third space-separated field, if any
+    keyword = no_date.str.extract(_RE_AGGREGATOR, expand=False)
+    vendor = upper.str.split(_RE_MULTI_SPACE, n=3, regex=True).str[2]
+    vendor = vendor.astype("string[pyarrow]")
+    vendor = vendor.str.replace(_RE_TRAIL_DATE, "", regex=True).str.strip()
+    result = result.mask(keyword.notna(), vendor.fillna(keyword))
+
+    return result.astype(object).where(payees.notna(), payees)
+
+
+def normalize_payee_column(payees: pd.Series) -> pd.Series:
+    """Normalize a column of payees, processing each distinct value once."""
+
+    uniq = pd.Series(payees.dropna().unique())
+    return payees.map(dict(zip(uniq, normalize_payee_series(uniq))))
+
+
 def confirm_category(suggested: str) -> str:
     """Prompt the user to accept or override a suggested category."""
 